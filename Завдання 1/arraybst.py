@@ -0,0 +1,594 @@
+"""
+File: arraybst.py
+An array-based binary search tree of integer items, stored as parallel
+NumPy arrays with the tree walks compiled by Numba when it is available.
+"""
+import numpy as np
+from math import inf, log2
+from numbers import Real
+from operator import index
+from abstractcollection import AbstractCollection
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Leaves functions as plain Python when Numba is not installed."""
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+
+_INT64_MIN = -2 ** 63
+_INT64_MAX = 2 ** 63 - 1
+
+
+def _search_key(item):
+    '''
+    Returns item as the int or float the tree walks search for.
+    Integers beyond the int64 range become -inf or inf, which order
+    the same way against every stored item but never match one.
+    Raises: TypeError if item is not a real number.
+    '''
+    try:
+        key = index(item)
+    except TypeError:
+        if not isinstance(item, Real):
+            raise TypeError("Cannot search for " + type(item).__name__
+                            + " in an ArrayBST") from None
+        return float(item)
+    if key < _INT64_MIN:
+        return -inf
+    if key > _INT64_MAX:
+        return inf
+    return key
+
+
+@njit(cache=True)
+def _insert(keys, left, right, root, slot, key):
+    '''
+    Stores key in slot and links it into the tree below root.
+    Returns the index of the root after the insertion.
+    '''
+    keys[slot] = key
+    left[slot] = -1
+    right[slot] = -1
+    if root == -1:
+        return slot
+
+    node = root
+    while True:
+        if key < keys[node]:
+            child = left[node]
+            if child == -1:
+                left[node] = slot
+                return root
+        else:
+            child = right[node]
+            if child == -1:
+                right[node] = slot
+                return root
+        node = child
+
+
+@njit(cache=True)
+def _find(keys, left, right, root, key):
+    '''
+    Returns the index of a node holding key, or -1 if there is none.
+    '''
+    node = root
+    while node != -1:
+        data = keys[node]
+        if key == data:
+            return node
+        if key < data:
+            node = left[node]
+        else:
+            node = right[node]
+    return -1
+
+
+@njit(cache=True)
+def _inorder_nodes(left, right, root, size):
+    '''
+    Returns an array of the node indexes of the tree in inorder.
+    '''
+    result = np.empty(size, np.int64)
+    stack = np.empty(size, np.int64)
+    top = 0
+    count = 0
+    node = root
+    while top > 0 or node != -1:
+        while node != -1:
+            stack[top] = node
+            top += 1
+            node = left[node]
+        top -= 1
+        node = stack[top]
+        result[count] = node
+        count += 1
+        node = right[node]
+    return result
+
+
+@njit(cache=True)
+def _inorder(keys, left, right, root, size):
+    '''
+    Returns an array of the keys of the tree in inorder.
+    '''
+    return keys[_inorder_nodes(left, right, root, size)]
+
+
+@njit(cache=True)
+def _preorder(keys, left, right, root, size):
+    '''
+    Returns an array of the keys of the tree in preorder.
+    '''
+    result = np.empty(size, keys.dtype)
+    if root == -1:
+        return result
+
+    stack = np.empty(size, np.int64)
+    stack[0] = root
+    top = 1
+    count = 0
+    while top > 0:
+        top -= 1
+        node = stack[top]
+        result[count] = keys[node]
+        count += 1
+        if right[node] != -1:
+            stack[top] = right[node]
+            top += 1
+        if left[node] != -1:
+            stack[top] = left[node]
+            top += 1
+    return result
+
+
+@njit(cache=True)
+def _remove(keys, left, right, root, key):
+    '''
+    Unlinks a node holding key from the tree below root.
+    Returns the new root index, the index of the freed slot, which is
+    -1 if key is not in the tree, and the key that was stored there.
+    '''
+    parent = -1
+    went_left = False
+    node = root
+    while node != -1:
+        data = keys[node]
+        if key == data:
+            break
+        parent = node
+        went_left = key < data
+        node = left[node] if went_left else right[node]
+    if node == -1:
+        return root, -1, 0
+
+    # Two children: move the maximum of the left subtree up into node
+    if left[node] != -1 and right[node] != -1:
+        top = node
+        parent = node
+        node = left[node]
+        while right[node] != -1:
+            parent = node
+            node = right[node]
+        removed = keys[top]
+        if parent == top:
+            left[top] = left[node]
+        else:
+            right[parent] = left[node]
+        keys[top] = keys[node]
+        return root, node, removed
+
+    child = left[node] if left[node] != -1 else right[node]
+    if parent == -1:
+        root = child
+    elif went_left:
+        left[parent] = child
+    else:
+        right[parent] = child
+    return root, node, keys[node]
+
+
+@njit(cache=True)
+def _successor(keys, left, right, root, key):
+    '''
+    Returns the index of the smallest key larger than key, or -1.
+    '''
+    best = -1
+    node = root
+    while node != -1:
+        if key < keys[node]:
+            best = node
+            node = left[node]
+        else:
+            node = right[node]
+    return best
+
+
+@njit(cache=True)
+def _predecessor(keys, left, right, root, key):
+    '''
+    Returns the index of the largest key smaller than key, or -1.
+    '''
+    best = -1
+    node = root
+    while node != -1:
+        if key > keys[node]:
+            best = node
+            node = right[node]
+        else:
+            node = left[node]
+    return best
+
+
+@njit(cache=True)
+def _range_find(keys, left, right, root, size, low, high):
+    '''
+    Returns an array of the keys k of the tree with low <= k <= high,
+    in sorted order.
+    '''
+    result = np.empty(size, keys.dtype)
+    stack = np.empty(size, np.int64)
+    top = 0
+    count = 0
+    node = root
+    while top > 0 or node != -1:
+        while node != -1:
+            stack[top] = node
+            top += 1
+            node = left[node] if keys[node] >= low else -1
+        top -= 1
+        node = stack[top]
+        data = keys[node]
+        if data > high:
+            break
+        if data >= low:
+            result[count] = data
+            count += 1
+        node = right[node]
+    return result[:count]
+
+
+@njit(cache=True)
+def _height(left, right, root, size):
+    '''
+    Returns the number of edges on the longest path down from root.
+    '''
+    if root == -1:
+        return 0
+
+    level = np.empty(size, np.int64)
+    level[0] = root
+    level_size = 1
+    height = -1
+    while level_size > 0:
+        height += 1
+        next_size = 0
+        # Children of the current level are written after it in place
+        for index in range(level_size):
+            node = level[index]
+            if left[node] != -1:
+                level[level_size + next_size] = left[node]
+                next_size += 1
+            if right[node] != -1:
+                level[level_size + next_size] = right[node]
+                next_size += 1
+        level[:next_size] = level[level_size:level_size + next_size]
+        level_size = next_size
+    return height
+
+
+@njit(cache=True)
+def _build_balanced(items, keys, left, right):
+    '''
+    Writes a balanced tree of the sorted items into the node arrays,
+    taking the middle item of every subrange as the subtree root.
+    Nodes are numbered in level order, so the root is at index 0
+    and every node sits close to its children.
+    '''
+    size = len(items)
+    low_queue = np.empty(size, np.int64)
+    high_queue = np.empty(size, np.int64)
+    low_queue[0] = 0
+    high_queue[0] = size - 1
+    tail = 1
+    for node in range(size):
+        low = low_queue[node]
+        high = high_queue[node]
+        middle = (low + high) // 2
+        keys[node] = items[middle]
+        left[node] = -1
+        right[node] = -1
+        if low < middle:
+            left[node] = tail
+            low_queue[tail] = low
+            high_queue[tail] = middle - 1
+            tail += 1
+        if middle < high:
+            right[node] = tail
+            low_queue[tail] = middle + 1
+            high_queue[tail] = high
+            tail += 1
+
+
+@njit(cache=True)
+def _veb_order(left, right, root, height, size):
+    '''
+    Returns the node indexes of the tree in van Emde Boas order: the top
+    half of the levels is laid out first, then each subtree hanging below
+    it, each of them split the same way. height counts levels.
+    '''
+    order = np.empty(size, np.int64)
+    count = 0
+    # Pending (subtree root, levels to lay out) pieces, last one first
+    stack_nodes = np.empty(size, np.int64)
+    stack_heights = np.empty(size, np.int64)
+    stack_nodes[0] = root
+    stack_heights[0] = height
+    top = 1
+    level = np.empty(size, np.int64)
+    while top > 0:
+        top -= 1
+        node = stack_nodes[top]
+        node_height = stack_heights[top]
+        if node_height == 1:
+            order[count] = node
+            count += 1
+            continue
+
+        # Find the roots of the bottom subtrees, top_height levels down
+        top_height = node_height // 2
+        level[0] = node
+        level_size = 1
+        for _ in range(top_height):
+            next_size = 0
+            for index in range(level_size):
+                child = left[level[index]]
+                if child != -1:
+                    level[level_size + next_size] = child
+                    next_size += 1
+                child = right[level[index]]
+                if child != -1:
+                    level[level_size + next_size] = child
+                    next_size += 1
+            level[:next_size] = level[level_size:level_size + next_size]
+            level_size = next_size
+
+        for index in range(level_size - 1, -1, -1):
+            stack_nodes[top] = level[index]
+            stack_heights[top] = node_height - top_height
+            top += 1
+        stack_nodes[top] = node
+        stack_heights[top] = top_height
+        top += 1
+    return order
+
+
+@njit(cache=True)
+def _permute(order, keys, left, right):
+    '''
+    Moves node order[i] of the tree into slot i, relinking the children.
+    Returns the new index of the root, which must be at slot 0.
+    '''
+    size = len(order)
+    position = np.empty(size, np.int64)
+    for index in range(size):
+        position[order[index]] = index
+    old_keys = keys[:size].copy()
+    old_left = left[:size].copy()
+    old_right = right[:size].copy()
+    for index in range(size):
+        node = order[index]
+        keys[index] = old_keys[node]
+        child = old_left[node]
+        left[index] = position[child] if child != -1 else -1
+        child = old_right[node]
+        right[index] = position[child] if child != -1 else -1
+    return position[0]
+
+
+class ArrayBST(AbstractCollection):
+    """An array-based binary search tree of integers.
+    Node i holds keys[i]; left[i] and right[i] are the indexes
+    of its children, or -1 if the child is absent.
+    Slots of removed nodes are kept on a free list for reuse."""
+
+    def __init__(self, sourceCollection=None, capacity=16):
+        """Sets the initial state of self, which includes the
+        contents of sourceCollection, if it's present."""
+        self._keys = np.empty(capacity, np.int64)
+        self._left = np.full(capacity, -1, np.int32)
+        self._right = np.full(capacity, -1, np.int32)
+        self._root = -1
+        self._used = 0
+        self._free = []
+        AbstractCollection.__init__(self, sourceCollection)
+
+    # Accessor methods
+    def __str__(self):
+        """Returns a string representation with the tree rotated
+        90 degrees counterclockwise."""
+        lines = []
+        stack = []
+        node = self._root
+        level = 0
+        # Reverse inorder walk: right subtree, node, left subtree
+        while stack or node != -1:
+            while node != -1:
+                stack.append((node, level))
+                node = self._right[node]
+                level += 1
+            node, level = stack.pop()
+            lines.append("| " * level + str(self._keys[node]) + "\n")
+            node = self._left[node]
+            level += 1
+        return "".join(lines)
+
+    def __iter__(self):
+        """Supports a preorder traversal on a view of self."""
+        keys = _preorder(self._keys, self._left, self._right,
+                         self._root, self._size)
+        return iter(keys.tolist())
+
+    def inorder(self):
+        """Supports an inorder traversal on a view of self."""
+        keys = _inorder(self._keys, self._left, self._right,
+                        self._root, self._size)
+        return iter(keys.tolist())
+
+    def __contains__(self, item):
+        """Returns True if target is found or False otherwise."""
+        return _find(self._keys, self._left, self._right,
+                     self._root, _search_key(item)) != -1
+
+    def find(self, item):
+        """If item matches an item in self, returns the
+        matched item, or None otherwise."""
+        node = _find(self._keys, self._left, self._right,
+                     self._root, _search_key(item))
+        if node == -1:
+            return None
+        return int(self._keys[node])
+
+    def height(self):
+        '''
+        Return the height of tree
+        :return: int
+        '''
+        return int(_height(self._left, self._right, self._root, self._size))
+
+    def is_balanced(self):
+        '''
+        Return True if tree is balanced
+        :return:
+        '''
+        return self.height() < 2 * log2(self._size + 1) - 1
+
+    def range_find(self, low, high):
+        '''
+        Returns a list of the items in the tree, where low <= item <= high.
+        :param low:
+        :param high:
+        :return:
+        '''
+        return _range_find(self._keys, self._left, self._right,
+                           self._root, self._size, _search_key(low),
+                           _search_key(high)).tolist()
+
+    def successor(self, item):
+        """
+        Returns the smallest item that is larger than
+        item, or None if there is no such item.
+        """
+        node = _successor(self._keys, self._left, self._right,
+                          self._root, _search_key(item))
+        if node == -1:
+            return None
+        return int(self._keys[node])
+
+    def predecessor(self, item):
+        """
+        Returns the largest item that is smaller than
+        item, or None if there is no such item.
+        """
+        node = _predecessor(self._keys, self._left, self._right,
+                            self._root, _search_key(item))
+        if node == -1:
+            return None
+        return int(self._keys[node])
+
+    # Mutator methods
+    def clear(self):
+        """Makes self become empty."""
+        self._root = -1
+        self._size = 0
+        self._used = 0
+        self._free = []
+
+    def add(self, item):
+        """Adds item to the tree.
+        Raises: TypeError if item is not an integer."""
+        item = index(item)
+        if self._free:
+            slot = self._free.pop()
+        else:
+            if self._used == len(self._keys):
+                self._grow()
+            slot = self._used
+            self._used += 1
+        self._root = _insert(self._keys, self._left, self._right,
+                             self._root, slot, item)
+        self._size += 1
+
+    def remove(self, item):
+        """Precondition: item is in self.
+        Raises: KeyError if item is not in self.
+        postcondition: item is removed from self."""
+        self._root, slot, removed = _remove(self._keys, self._left,
+                                            self._right, self._root,
+                                            _search_key(item))
+        if slot == -1:
+            raise KeyError("Item not in tree.")
+        self._free.append(slot)
+        self._size -= 1
+        return int(removed)
+
+    def replace(self, item, new_item):
+        """
+        If item is in self, replaces it with newItem and
+        returns the old item, or returns None otherwise.
+        Raises: TypeError if new_item is not an integer."""
+        new_item = index(new_item)
+        node = _find(self._keys, self._left, self._right,
+                     self._root, _search_key(item))
+        if node == -1:
+            return None
+        old_data = int(self._keys[node])
+        self._keys[node] = new_item
+        return old_data
+
+    def rebalance(self, layout="veb"):
+        '''
+        Rebalances the tree, packing its nodes into the first slots of
+        the arrays. layout picks the order of the nodes in memory:
+        "veb" (van Emde Boas, fewest cache misses per search),
+        "inorder" (sorted by item) or "bfs" (level order).
+        :return:
+        '''
+        if layout not in ("veb", "inorder", "bfs"):
+            raise ValueError("Unknown layout: " + str(layout))
+        if self.isEmpty():
+            return
+
+        items = _inorder(self._keys, self._left, self._right,
+                         self._root, self._size)
+        _build_balanced(items, self._keys, self._left, self._right)
+        self._root = 0
+        self._used = self._size
+        self._free = []
+
+        if layout == "veb":
+            order = _veb_order(self._left, self._right, 0,
+                               self._size.bit_length(), self._size)
+        elif layout == "inorder":
+            order = _inorder_nodes(self._left, self._right, 0, self._size)
+        else:
+            return
+        self._root = int(_permute(order, self._keys, self._left, self._right))
+
+    def _grow(self):
+        '''
+        Doubles the capacity of the node arrays.
+        '''
+        capacity = len(self._keys)
+        new_capacity = max(2 * capacity, 1)
+        keys = np.empty(new_capacity, np.int64)
+        left = np.full(new_capacity, -1, np.int32)
+        right = np.full(new_capacity, -1, np.int32)
+        keys[:capacity] = self._keys
+        left[:capacity] = self._left
+        right[:capacity] = self._right
+        self._keys, self._left, self._right = keys, left, right
@@ -3,10 +3,19 @@ File: bstnode.py
 Author: Ken Lambert
 """
 
+# Default for key, so that a key of None can still be stored
+_NO_KEY = object()
+
 class BSTNode(object):
     """Represents a node for a linked binary search tree."""
 
-    def __init__(self, data, left = None, right = None):
+    __slots__ = ("data", "key", "left", "right", "height")
+
+    def __init__(self, data, left = None, right = None, key = _NO_KEY):
         self.data = data
+        # What the tree orders nodes by, the data itself by default
+        self.key = data if key is _NO_KEY else key
         self.left = left
         self.right = right
+        # Number of levels in the subtree rooted here, kept by AVL trees
+        self.height = 1
@@ -0,0 +1,41 @@
+"""
+File: layout_benchmark.py
+Times ArrayBST.find() after rebalancing the tree into each memory layout.
+Usage: python layout_benchmark.py [tree_size] [searches]
+"""
+import sys
+from random import sample, choices, seed
+from time import perf_counter
+from arraybst import ArrayBST
+
+
+def benchmark_layouts(tree_size=200000, searches=200000):
+    '''
+    Builds a tree of tree_size random items and returns a dict that maps
+    every layout to the seconds taken by searches calls to find().
+    :param tree_size:
+    :param searches:
+    :return: dict
+    '''
+    seed(0)
+    items = sample(range(10 * tree_size), tree_size)
+    look_for = choices(items, k=searches)
+    tree = ArrayBST(items)
+    # Compiles the search kernel before anything is timed
+    tree.find(look_for[0])
+
+    times = {}
+    for layout in ("veb", "bfs", "inorder"):
+        tree.rebalance(layout)
+        find = tree.find
+        start = perf_counter()
+        for item in look_for:
+            find(item)
+        times[layout] = perf_counter() - start
+    return times
+
+
+if __name__ == "__main__":
+    sizes = [int(argument) for argument in sys.argv[1:3]]
+    for layout, seconds in benchmark_layouts(*sizes).items():
+        print(f'{layout}: {seconds:.3f} seconds')
@@ -2,18 +2,72 @@
 File: linkedbst.py
 Author: Ken Lambert
 """
-from math import log, floor
+from math import log, log2
+from bisect import bisect_left, bisect_right
 from abstractcollection import AbstractCollection
 from bstnode import BSTNode
-from linkedstack import LinkedStack
+
+
+def _height(position):
+    """Returns the stored AVL height of position, 0 for None."""
+    return 0 if position is None else position.height
+
+
+def _update_height(position):
+    """Recomputes the AVL height of position from its children."""
+    position.height = 1 + max(_height(position.left),
+                              _height(position.right))
+
+
+def _rotate_left(position):
+    """Rotates position down to the left and returns its right child,
+    the new root of the subtree."""
+    pivot = position.right
+    position.right = pivot.left
+    pivot.left = position
+    _update_height(position)
+    _update_height(pivot)
+    return pivot
+
+
+def _rotate_right(position):
+    """Rotates position down to the right and returns its left child,
+    the new root of the subtree."""
+    pivot = position.left
+    position.left = pivot.right
+    pivot.right = position
+    _update_height(position)
+    _update_height(pivot)
+    return pivot
+
 
 class LinkedBST(AbstractCollection):
     """An link-based binary search tree implementation."""
 
-    def __init__(self, sourceCollection=None):
+    # Weight-balance factor for scapegoat rebuilds, 0.5 < alpha < 1
+    _alpha = 0.57
+
+    def __init__(self, sourceCollection=None, balance="scapegoat",
+                 key=None):
         """Sets the initial state of self, which includes the
-        contents of sourceCollection, if it's present."""
+        contents of sourceCollection, if it's present.
+        balance is "scapegoat" to rebuild unbalanced subtrees
+        on insertion, "avl" to keep the tree AVL-balanced with
+        rotations on every add and remove, or None to never
+        rebalance automatically.
+        key, if given, is a function of one item whose result is
+        used to order the items, as in sorted(); it is also applied
+        to the items passed to searches.
+        Raises: ValueError if balance is not one of those modes."""
+        if balance not in ("scapegoat", "avl", None):
+            raise ValueError("Unknown balance: " + str(balance))
         self._root = None
+        self._balance = balance
+        self._key = key
+        # Sorted lists of the items and of their keys for the order
+        # queries, and how many of them ran since the tree last changed
+        self._sorted_cache = None
+        self._order_queries = 0
         AbstractCollection.__init__(self, sourceCollection)
 
     # Accessor methods
@@ -21,102 +75,178 @@ class LinkedBST(AbstractCollection):
         """Returns a string representation with the tree rotated
         90 degrees counterclockwise."""
 
-        def recurse(node, level):
-            string = ""
-            if node is not None:
-                string += recurse(node.right, level + 1)
-                string += "| " * level
-                string += str(node.data) + "\n"
-                string += recurse(node.left, level + 1)
-            return string
-
-        return recurse(self._root, 0)
+        lines = []
+        stack = []
+        node = self._root
+        level = 0
+        # Reverse inorder walk: right subtree, node, left subtree
+        while stack or node is not None:
+            while node is not None:
+                stack.append((node, level))
+                node = node.right
+                level += 1
+            node, level = stack.pop()
+            lines.append("| " * level + str(node.data) + "\n")
+            node = node.left
+            level += 1
+        return "".join(lines)
 
     def __iter__(self):
         """Supports a preorder traversal on a view of self."""
         if not self.isEmpty():
-            stack = LinkedStack()
-            stack.push(self._root)
-            while not stack.isEmpty():
+            stack = [self._root]
+            while stack:
                 node = stack.pop()
                 yield node.data
                 if node.right is not None:
-                    stack.push(node.right)
+                    stack.append(node.right)
                 if node.left is not None:
-                    stack.push(node.left)
+                    stack.append(node.left)
 
     def inorder(self):
         """Supports an inorder traversal on a view of self."""
-        lyst = list()
+        return iter([node.data for node in self._subtree_inorder()])
 
-        def recurse(node):
-            if node is not None:
-                recurse(node.left)
-                lyst.append(node.data)
-                recurse(node.right)
+    def _order_cache(self):
+        '''
+        Returns the (items, keys) lists sorted by key for successor,
+        predecessor and range_find, or None. The lists are built only
+        once the descents made since the tree last changed have cost
+        about as much as the O(n) walk that builds them.
+        :return: tuple
+        '''
+        if self._sorted_cache is None:
+            self._order_queries += 1
+            if self._order_queries * self._size.bit_length() < self._size:
+                return None
+            nodes = list(self._subtree_inorder())
+            items = [node.data for node in nodes]
+            keys = items if self._key is None else [node.key for node in nodes]
+            self._sorted_cache = items, keys
+        return self._sorted_cache
 
-        recurse(self._root)
-        return iter(lyst)
+    def _forget_order(self):
+        '''
+        Drops the sorted lists of the order queries after a change.
+        '''
+        self._sorted_cache = None
+        self._order_queries = 0
 
     def __contains__(self, item):
         """Returns True if target is found or False otherwise."""
-        return self.find(item) is not None
+        key = item if self._key is None else self._key(item)
+        node = self._root
+        while node is not None:
+            node_key = node.key
+            if key == node_key:
+                return True
+            if key < node_key:
+                node = node.left
+            else:
+                node = node.right
+        return False
+
+    def __add__(self, other):
+        """Returns a new tree containing the contents of self and
+        other, ordered and balanced the same way as self."""
+        result = type(self)(self, balance=self._balance, key=self._key)
+        for item in other:
+            result.add(item)
+        return result
 
     def find(self, item):
         """If item matches an item in self, returns the
         matched item, or None otherwise."""
-
-        def recurse(node):
-            if node is None:
-                return None
-            if item == node.data:
+        key = item if self._key is None else self._key(item)
+        node = self._root
+        while node is not None:
+            node_key = node.key
+            if key == node_key:
                 return node.data
-            if item < node.data:
-                return recurse(node.left)
-
-            return recurse(node.right)
-
-        return recurse(self._root)
+            if key < node_key:
+                node = node.left
+            else:
+                node = node.right
+        return None
 
     # Mutator methods
     def clear(self):
         """Makes self become empty."""
         self._root = None
         self._size = 0
+        self._forget_order()
 
     def add(self, item):
         """Adds item to the tree."""
+        self._forget_order()
+        key = item if self._key is None else self._key(item)
 
-        # Helper function to search for item's position
-        def recurse(node):
+        # Tree is empty, so new item goes at the root
+        if self.isEmpty():
+            self._root = BSTNode(item, key=key)
+            self._size += 1
+            return
+
+        # Otherwise, search for the item's spot
+        path = []
+        node = self._root
+        while True:
+            path.append(node)
             # New item is less, go left until spot is found
-            if item < node.data:
-                if node.left is None:
-                    node.left = BSTNode(item)
-                else:
-                    recurse(node.left)
+            if key < node.key:
+                left = node.left
+                if left is None:
+                    new_node = node.left = BSTNode(item, key=key)
+                    break
+                node = left
             # New item is greater or equal,
             # go right until spot is found
-            elif node.right is None:
-                node.right = BSTNode(item)
             else:
-                recurse(node.right)
-                # End of recurse
+                right = node.right
+                if right is None:
+                    new_node = node.right = BSTNode(item, key=key)
+                    break
+                node = right
+        self._size += 1
 
-        # Tree is empty, so new item goes at the root
-        if self.isEmpty():
-            self._root = BSTNode(item)
-        # Otherwise, search for the item's spot
+        if self._balance == "avl":
+            self._retrace(path)
+        # The new node is too deep, so some ancestor is out of balance
+        elif self._balance == "scapegoat" and \
+                len(path) > log(self._size, 1 / self._alpha):
+            self._rebuild_scapegoat(path, new_node)
+
+    def _rebuild_scapegoat(self, path, node):
+        '''
+        Finds the lowest ancestor of node whose child subtree holds more
+        than alpha of its nodes and rebuilds that subtree balanced.
+        :param path: ancestors of node, from the root down
+        :param node: the node just inserted
+        :return:
+        '''
+        child, child_size = node, 1
+        for index in range(len(path) - 1, -1, -1):
+            parent = path[index]
+            sibling = parent.right if parent.left is child else parent.left
+            parent_size = child_size + 1 + self._subtree_size(sibling)
+            if child_size > self._alpha * parent_size:
+                break
+            child, child_size = parent, parent_size
         else:
-            recurse(self._root)
-        self._size += 1
+            return
+
+        subtree = self._build_balanced(self._morris_inorder(parent))
+        if index == 0:
+            self._root = subtree
+        elif path[index - 1].left is parent:
+            path[index - 1].left = subtree
+        else:
+            path[index - 1].right = subtree
 
     def remove(self, item):
         """Precondition: item is in self.
         Raises: KeyError if item is not in self.
         postcondition: item is removed from self."""
-        if not item in self:
-            raise KeyError("Item not in tree.""")
 
         # Helper function to adjust placement of an item
         def lift(top):
@@ -126,91 +256,131 @@ class LinkedBST(AbstractCollection):
             # Post: the maximum node in top's left subtree
             #       has been removed
             # Post: top.data = maximum value in top's left subtree
+            # Post: path ends with the parent of the removed node
             '''
+            path.append(top)
             parent = top
             current_node = top.left
-            while not current_node.right is None:
+            right = current_node.right
+            while right is not None:
+                path.append(current_node)
                 parent = current_node
-                current_node = current_node.right
+                current_node = right
+                right = current_node.right
             top.data = current_node.data
-            if parent == top:
+            top.key = current_node.key
+            if parent is top:
                 top.left = current_node.left
             else:
                 parent.right = current_node.left
 
-        # Begin main part of the method
-        if self.isEmpty():
-            return None
-
         # Attempt to locate the node containing the item
-        item_removed = None
-        pre_root = BSTNode(None)
-        pre_root.left = self._root
-        parent = pre_root
-        direction = 'L'
+        key = item if self._key is None else self._key(item)
+        path = []
+        went_left = False
         current_node = self._root
-        while not current_node is None:
-            if current_node.data == item:
-                item_removed = current_node.data
+        while current_node is not None:
+            node_key = current_node.key
+            if node_key == key:
                 break
-            parent = current_node
-            if current_node.data > item:
-                direction = 'L'
+            path.append(current_node)
+            went_left = node_key > key
+            if went_left:
                 current_node = current_node.left
             else:
-                direction = 'R'
                 current_node = current_node.right
 
-        # Return None if the item is absent
-        if item_removed is None:
-            return None
-
-        # The item is present, so remove its node
+        # The descent fell off the tree, so the item is absent
+        if current_node is None:
+            raise KeyError("Item not in tree.")
+        self._forget_order()
+        data = current_node.data
 
         # Case 1: The node has a left and a right child
         #         Replace the node's value with the maximum value in the
         #         left subtree
         #         Delete the maximium node in the left subtree
-        if not current_node.left is None \
-                and not current_node.right is None:
+        left = current_node.left
+        right = current_node.right
+        if left is not None and right is not None:
             lift(current_node)
         else:
-
             # Case 2: The node has no left child
-            if current_node.left is None:
-                new_child = current_node.right
-
-                # Case 3: The node has no right child
-            else:
-                new_child = current_node.left
-
-                # Case 2 & 3: Tie the parent to the new child
-            if direction == 'L':
-                parent.left = new_child
+            # Case 3: The node has no right child
+            new_child = right if left is None else left
+
+            # Case 2 & 3: Tie the parent (or the root) to the new child
+            if not path:
+                self._root = new_child
+            elif went_left:
+                path[-1].left = new_child
             else:
-                parent.right = new_child
+                path[-1].right = new_child
 
-        # All cases: Reset the root (if it hasn't changed no harm done)
-        #            Decrement the collection's size counter
-        #            Return the item
+        if self._balance == "avl":
+            self._retrace(path)
         self._size -= 1
-        if self.isEmpty():
-            self._root = None
-        else:
-            self._root = pre_root.left
-        return item_removed
+        return data
+
+    def _retrace(self, path):
+        '''
+        Walks back up path after an AVL insertion or removal, updating
+        heights and rotating every node whose subtrees now differ in
+        height by more than one. Stops once a subtree height is unchanged.
+        :param path: nodes from the root down to the changed subtree
+        :return:
+        '''
+        for index in range(len(path) - 1, -1, -1):
+            node = path[index]
+            old_height = node.height
+            subtree = self._avl_fix(node)
+            if subtree is not node:
+                if index == 0:
+                    self._root = subtree
+                elif path[index - 1].left is node:
+                    path[index - 1].left = subtree
+                else:
+                    path[index - 1].right = subtree
+            if subtree.height == old_height:
+                break
+
+    @staticmethod
+    def _avl_fix(node):
+        '''
+        Restores the AVL property at node, whose subtrees are AVL trees.
+        Returns the root of the fixed subtree.
+        :param node:
+        :return: BSTNode
+        '''
+        left, right = node.left, node.right
+        balance = _height(left) - _height(right)
+        if balance > 1:
+            if _height(left.left) < _height(left.right):
+                node.left = _rotate_left(left)
+            return _rotate_right(node)
+        if balance < -1:
+            if _height(right.right) < _height(right.left):
+                node.right = _rotate_right(right)
+            return _rotate_left(node)
+        _update_height(node)
+        return node
 
     def replace(self, item, new_item):
         """
         If item is in self, replaces it with newItem and
         returns the old item, or returns None otherwise."""
+        key = item if self._key is None else self._key(item)
         probe = self._root
         while probe is not None:
-            if probe.data == item:
+            probe_key = probe.key
+            if probe_key == key:
                 old_data = probe.data
                 probe.data = new_item
+                probe.key = new_item if self._key is None \
+                    else self._key(new_item)
+                self._forget_order()
                 return old_data
-            if probe.data > item:
+            if probe_key > key:
                 probe = probe.left
             else:
                 probe = probe.right
@@ -220,12 +390,27 @@ class LinkedBST(AbstractCollection):
     def root(self):
         '''
         Returns the root of the tree.
+        After editing nodes reached through it directly, assign root
+        again so the size and the cached order of the items are reset.
         '''
         return self._root
 
     @root.setter
     def root(self, other):
         self._root = other
+        if self._balance == "avl":
+            # Children come after their parents in level order,
+            # so heights can be restored bottom-up in reverse
+            nodes = [] if other is None else [other]
+            for node in nodes:
+                nodes.extend(child for child in (node.left, node.right)
+                             if child is not None)
+            for node in reversed(nodes):
+                _update_height(node)
+            self._size = len(nodes)
+        else:
+            self._size = self._subtree_size(other)
+        self._forget_order()
 
     def children(self, position):
         '''
@@ -243,21 +428,17 @@ class LinkedBST(AbstractCollection):
     def num_children(self, position):
         '''
         Returns a number of children of the node on a given position.
+        Raises: ValueError if position is None.
         '''
         if position is None:
-            return False
-
-        number = 2
-        if position.left is None:
-            number -= 1
-        if position.right is None:
-            number -= 1
+            raise ValueError("Position is not a node of the tree.")
 
-        return number
+        return (position.left is not None) + (position.right is not None)
 
     def is_leaf(self, position):
         '''
         Returns if the given node is a leaf.
+        Raises: ValueError if position is None.
         '''
         return self.num_children(position) == 0
 
@@ -273,29 +454,60 @@ class LinkedBST(AbstractCollection):
         :return: int
         '''
 
-        def height1(position):
-            '''
-            Helper function
-            :param top:
-            :return:
-            '''
-            if self.is_leaf(position):
-                return 0
-
-            return 1 + max(height1(child) for child in self.children(position))
-
         if position is None:
             position = self.root
-
-        return height1(position)
+        if position is None:
+            return 0
+        if self._balance == "avl":
+            # AVL nodes store their height, counting a leaf as 1
+            return position.height - 1
+        return self._subtree_height(position)
+
+    @staticmethod
+    def _subtree_size(position):
+        '''
+        Returns the number of nodes in the subtree rooted at position.
+        :param position:
+        :return: int
+        '''
+        if position is None:
+            return 0
+
+        size = 0
+        stack = [position]
+        while stack:
+            node = stack.pop()
+            size += 1
+            if node.left is not None:
+                stack.append(node.left)
+            if node.right is not None:
+                stack.append(node.right)
+        return size
+
+    @staticmethod
+    def _subtree_height(position):
+        '''
+        Returns the height of the subtree rooted at position,
+        walking it one level at a time.
+        :param position:
+        :return: int
+        '''
+        height = 0
+        level = [position]
+        while True:
+            level = [child for node in level
+                     for child in (node.left, node.right)
+                     if child is not None]
+            if not level:
+                return height
+            height += 1
 
     def is_balanced(self):
         '''
         Return True if tree is balanced
         :return:
         '''
-        number = len(list(self.inorder()))
-        return self.height() < 2 * log(number + 1, 2) - 1
+        return self.height() < 2 * log2(self._size + 1) - 1
 
     def range_find(self, low, high):
         '''
@@ -304,10 +516,29 @@ class LinkedBST(AbstractCollection):
         :param high:
         :return:
         '''
+        if self._key is not None:
+            low, high = self._key(low), self._key(high)
+        cache = self._order_cache()
+        if cache is not None:
+            items, keys = cache
+            return items[bisect_left(keys, low):bisect_right(keys, high)]
+
         items = []
-        for node_item in self.inorder():
-            if node_item in range(low, high + 1):
-                items.append(node_item)
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            # Go left only while the left subtree can still hold items >= low
+            while node is not None:
+                stack.append(node)
+                node = node.left if node.key >= low else None
+            node = stack.pop()
+            node_key = node.key
+            # Items come out sorted, so nothing after this one is <= high
+            if node_key > high:
+                break
+            if node_key >= low:
+                items.append(node.data)
+            node = node.right
 
         return items
 
@@ -316,42 +547,92 @@ class LinkedBST(AbstractCollection):
         if position is None:
             position = self.root
 
-        if position.left is not None: # if left child exists, traverse its subtree
-            for other in self._subtree_inorder(position.left):
-                yield other
-        yield position # visit p between its subtrees
-        if position.right is not None: # if right child exists, traverse its subtree
-            for other in self._subtree_inorder(position.right):
-                yield other
+        stack = []
+        while stack or position is not None:
+            while position is not None: # go down to the leftmost position
+                stack.append(position)
+                position = position.left
+            position = stack.pop()
+            yield position # visit p between its subtrees
+            position = position.right
+
+    @staticmethod
+    def _morris_inorder(position):
+        '''
+        Returns a list of the positions in the subtree rooted at position,
+        in inorder, using Morris traversal: instead of a stack, the rightmost
+        node of each left subtree is threaded back to its inorder successor
+        and unthreaded on the second visit.
+        :param position:
+        :return: list
+        '''
+        positions = []
+        while position is not None:
+            left = position.left
+            if left is None:
+                positions.append(position)
+                position = position.right
+                continue
+
+            predecessor = left
+            right = predecessor.right
+            while right is not None and right is not position:
+                predecessor = right
+                right = predecessor.right
+            if right is None:
+                predecessor.right = position
+                position = left
+            else:
+                predecessor.right = None
+                positions.append(position)
+                position = position.right
+        return positions
 
     def rebalance(self):
         '''
         Rebalances the tree.
         :return:
         '''
-        items = self._subtree_inorder()
-        items = list(sorted([item.data for item in items]))
-        self.clear()
-        lenght = len(items) - 1
-        self.root = BSTNode(items.pop(floor(lenght/2)))
+        if self.isEmpty():
+            return
 
-        nodes = [self.root]
-        new_nodes = []
-        while lenght > 0:
-            for node in nodes:
-                if lenght == 0:
-                    break
-                node.left = BSTNode(items.pop(floor(lenght/2)))
-                lenght -= 1
+        # An inorder walk of a search tree already yields nodes in key order
+        nodes = self._morris_inorder(self._root)
+        self._root = self._build_balanced(nodes)
+        self._size = len(nodes)
+        self._forget_order()
 
-                if lenght == 0:
-                    break
-                node.right = BSTNode(items.pop(floor(lenght/2)))
-                lenght -=1
+    @staticmethod
+    def _build_balanced(nodes):
+        '''
+        Relinks a list of nodes sorted by key into a balanced tree by
+        taking the middle node of every subrange as the subtree root.
+        :param nodes:
+        :return: BSTNode
+        '''
+        if not nodes:
+            return None
 
-                new_nodes += [node.left, node.right]
+        low, high = 0, len(nodes) - 1
+        root = nodes[(low + high) // 2]
+        stack = [(root, low, high)]
+        while stack:
+            node, low, high = stack.pop()
+            # A midpoint-built subtree of n nodes has n.bit_length() levels
+            node.height = (high - low + 1).bit_length()
+            middle = (low + high) // 2
+            if low < middle:
+                node.left = nodes[(low + middle - 1) // 2]
+                stack.append((node.left, low, middle - 1))
+            else:
+                node.left = None
+            if middle < high:
+                node.right = nodes[(middle + 1 + high) // 2]
+                stack.append((node.right, middle + 1, high))
+            else:
+                node.right = None
 
-            nodes = new_nodes
+        return root
 
     def successor(self, item):
         """
@@ -362,13 +643,21 @@ class LinkedBST(AbstractCollection):
         :return:
         :rtype:
         """
+        key = item if self._key is None else self._key(item)
+        cache = self._order_cache()
+        if cache is not None:
+            items, keys = cache
+            index = bisect_right(keys, key)
+            return items[index] if index < len(items) else None
+
         successor = None
-        for node_item in self.inorder():
-            if node_item > item:
-                if successor is None:
-                    successor = node_item
-                if node_item < successor:
-                    successor = node_item
+        node = self._root
+        while node is not None:
+            if key < node.key:
+                successor = node.data
+                node = node.left
+            else:
+                node = node.right
 
         return successor
 
@@ -381,12 +670,20 @@ class LinkedBST(AbstractCollection):
         :return:
         :rtype:
         """
+        key = item if self._key is None else self._key(item)
+        cache = self._order_cache()
+        if cache is not None:
+            items, keys = cache
+            index = bisect_left(keys, key)
+            return items[index - 1] if index > 0 else None
+
         predecessor = None
-        for node_item in self.inorder():
-            if node_item < item:
-                if predecessor is None:
-                    predecessor = node_item
-                if node_item > predecessor:
-                    predecessor = node_item
+        node = self._root
+        while node is not None:
+            if key > node.key:
+                predecessor = node.data
+                node = node.right
+            else:
+                node = node.left
 
         return predecessor
@@ -3,11 +3,10 @@ File: linkedbst.py
 Author: Ken Lambert
 """
 from random import choices
-from math import log, floor
+from math import log
 from time import time
 from abstractcollection import AbstractCollection
 from bstnode import BSTNode
-from linkedstack import LinkedStack
 
 class LinkedBST(AbstractCollection):
     """An link-based binary search tree implementation."""
@@ -37,15 +36,14 @@ class LinkedBST(AbstractCollection):
     def __iter__(self):
         """Supports a preorder traversal on a view of self."""
         if not self.isEmpty():
-            stack = LinkedStack()
-            stack.push(self._root)
-            while not stack.isEmpty():
+            stack = [self._root]
+            while stack:
                 node = stack.pop()
                 yield node.data
                 if node.right is not None:
-                    stack.push(node.right)
+                    stack.append(node.right)
                 if node.left is not None:
-                    stack.push(node.left)
+                    stack.append(node.left)
 
     def inorder(self):
         """Supports an inorder traversal on a view of self."""
@@ -331,29 +329,26 @@ class LinkedBST(AbstractCollection):
         Rebalances the tree.
         :return:
         '''
-        items = self._subtree_inorder()
-        items = list(sorted([item.data for item in items]))
-        self.clear()
-        lenght = len(items) - 1
-        self.root = BSTNode(items.pop(floor(lenght/2)))
-
-        nodes = [self.root]
-        new_nodes = []
-        while lenght > 0:
-            for node in nodes:
-                if lenght == 0:
-                    break
-                node.left = BSTNode(items.pop(floor(lenght/2)))
-                lenght -= 1
-
-                if lenght == 0:
-                    break
-                node.right = BSTNode(items.pop(floor(lenght/2)))
-                lenght -=1
-
-                new_nodes += [node.left, node.right]
-
-            nodes = new_nodes
+        if self.isEmpty():
+            return
+
+        # Inorder of a search tree is already sorted
+        items = [item.data for item in self._subtree_inorder()]
+        self._root = BSTNode(items[(len(items) - 1) // 2])
+        self._size = len(items)
+
+        # Take the middle item of every (low, high) index range as the
+        # subtree root, instead of popping items out of the list
+        stack = [(self._root, 0, len(items) - 1)]
+        while stack:
+            node, low, high = stack.pop()
+            middle = (low + high) // 2
+            if low < middle:
+                node.left = BSTNode(items[(low + middle - 1) // 2])
+                stack.append((node.left, low, middle - 1))
+            if middle < high:
+                node.right = BSTNode(items[(middle + 1 + high) // 2])
+                stack.append((node.right, middle + 1, high))
 
     def successor(self, item):
         """